@@ -1,22 +1,72 @@
 """
 API Server for Port-to-Rail Analytics
 Bridges the frontend UI to Ollama for real-time logistics queries
+
+Production: gunicorn -c gunicorn.conf.py api_server:app
 """
 
-from flask import Flask, request, jsonify
+# Patch blocking I/O (sockets, sleeps, threads) before anything else imports it,
+# so Ollama calls and file I/O yield to other greenlets under gevent workers
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
+import csv
 import os
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
+import numpy as np
+import functools
+import threading
+import time
+import fcntl
+import contextlib
+import tempfile
+import itertools
+import traceback
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Serialize responses and parse request bodies with orjson (Rust) instead of stdlib json"""
+    
+    def dumps(self, obj, **kwargs):
+        # orjson never sorts keys or indents, so responses are compact in debug
+        # mode too; the indent/separators kwargs Flask passes are ignored
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+app.config.update(COMPRESS_MIMETYPES=['application/json'], COMPRESS_LEVEL=6)
 CORS(app)  # Allow cross-origin requests from frontend
+Compress(app)  # gzip/br JSON responses for clients that accept it
 
 # Ollama configuration
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "qwen2.5:1.5b")
+# Ollama only runs requests concurrently when its server is started with
+# OLLAMA_NUM_PARALLEL > 1; otherwise concurrent calls queue inside Ollama.
+# Read here so the startup banner shows what the deployment expects.
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+OLLAMA_MAX_LOADED_MODELS = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS", 2))
+# Token budget for /api/chat answers; clients may ask for fewer via ?max_tokens=
+CHAT_NUM_PREDICT = int(os.environ.get("CHAT_NUM_PREDICT", 500))
+
+# Shared HTTP session so Ollama calls reuse pooled keep-alive connections
+# instead of opening a new TCP connection per request
+OLLAMA_SESSION = requests.Session()
+_ollama_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0)
+OLLAMA_SESSION.mount('http://', _ollama_adapter)
+OLLAMA_SESSION.mount('https://', _ollama_adapter)
+OLLAMA_SESSION.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
 
 # System prompt for port logistics analysis
 SYSTEM_PROMPT = """You are an AI assistant specialized in port-to-rail logistics analysis for the Port of Houston. 
@@ -32,7 +82,38 @@ Always provide structured, actionable insights for port operators and logistics
 Format numerical data clearly and include risk classifications when relevant."""
 
 # Simulated baseline data (in production, this would come from your database)
+_RNG = np.random.default_rng()
+
+def _hour_bucket(hour):
+    """Time-of-day period and base volume multiplier for an hour (0-23)"""
+    if 6 <= hour <= 10:  # Morning peak
+        return 'peak_am', 1.4
+    elif 14 <= hour <= 18:  # Afternoon peak
+        return 'peak_pm', 1.5
+    elif 22 <= hour or hour <= 5:  # Night (low)
+        return 'night', 0.6
+    else:  # Normal hours
+        return 'normal', 1.0
+
+# Hour-of-day lookup shared by current metrics and the forecast
+_HOUR_BUCKET = [_hour_bucket(h) for h in range(24)]
+# Upper bound of the random noise on the current multiplier (peaks skew upward)
+_PERIOD_NOISE_HIGH = {'peak_am': 0.2, 'peak_pm': 0.2, 'night': 0.1, 'normal': 0.1}
+# Forecast surge risk per period (afternoon peak is raised to HIGH near-term)
+_PERIOD_RISK = {'peak_am': 'MEDIUM', 'peak_pm': 'MEDIUM', 'night': 'LOW', 'normal': 'LOW'}
+
+# Metrics and forecast are memoized per wall-clock second so every request in
+# that second shares one result; callers must treat the returned data as read-only.
 def get_current_metrics():
+    """Current port metrics (cached for the current second)"""
+    return _current_metrics_for_second(int(time.time()))
+
+def get_hourly_forecast():
+    """24-hour forecast (cached for the current second)"""
+    return _hourly_forecast_for_second(int(time.time()))
+
+@functools.lru_cache(maxsize=2)
+def _current_metrics_for_second(second):
     """Generate current port metrics based on time of day and patterns"""
     now = datetime.now()
     hour = now.hour
@@ -41,14 +122,13 @@ def get_current_metrics():
     base_teu = 150  # baseline TEU per hour
     
     # Peak hour multipliers
-    if 6 <= hour <= 10:  # Morning peak
-        multiplier = 1.4 + random.uniform(-0.1, 0.2)
-    elif 14 <= hour <= 18:  # Afternoon peak
-        multiplier = 1.5 + random.uniform(-0.1, 0.2)
-    elif 22 <= hour or hour <= 5:  # Night (low)
-        multiplier = 0.6 + random.uniform(-0.1, 0.1)
-    else:  # Normal hours
-        multiplier = 1.0 + random.uniform(-0.1, 0.1)
+    period, multiplier = _HOUR_BUCKET[hour]
+    noise_high = _PERIOD_NOISE_HIGH[period]
+    
+    # Draw all random components in two vectorized calls
+    noise, dwell_time = _RNG.uniform([-0.1, 18.0], [noise_high, 36.0]).tolist()
+    vessels_in_channel, vessels_at_berth, rail_cars_waiting = _RNG.integers([15, 8, 50], [36, 19, 201]).tolist()
+    multiplier += noise
     
     current_teu = int(base_teu * multiplier)
     baseline_30day = 145  # 30-day rolling average
@@ -69,50 +149,128 @@ def get_current_metrics():
         "baseline_30day_avg": baseline_30day,
         "percent_deviation": round(deviation, 1),
         "surge_risk": surge_risk,
-        "vessels_in_channel": random.randint(15, 35),
-        "vessels_at_berth": random.randint(8, 18),
-        "rail_cars_waiting": random.randint(50, 200),
-        "avg_dwell_time_hours": round(random.uniform(18, 36), 1)
+        "vessels_in_channel": vessels_in_channel,
+        "vessels_at_berth": vessels_at_berth,
+        "rail_cars_waiting": rail_cars_waiting,
+        "avg_dwell_time_hours": round(dwell_time, 1)
     }
 
-def get_hourly_forecast():
+# Forecast pattern per hour of day (0-23), precomputed so building the
+# forecast is a table gather instead of a branch chain per hour
+_FORECAST_BASE_TEU = 150
+_HOUR_MULT = np.array([multiplier for _, multiplier in _HOUR_BUCKET])
+_HOUR_RISK = np.array([_PERIOD_RISK[period] for period, _ in _HOUR_BUCKET])
+_HOUR_IS_PM_PEAK = np.array([period == 'peak_pm' for period, _ in _HOUR_BUCKET])
+_HOUR_EXPECTED_TEU = (_FORECAST_BASE_TEU * _HOUR_MULT).astype(int)
+_HOUR_DEVIATION = np.round((_HOUR_MULT - 1) * 100, 1)
+_HOUR_STR = [f"{h:02d}:00" for h in range(24)]
+
+@functools.lru_cache(maxsize=2)
+def _hourly_forecast_for_second(second):
     """Generate 24-hour forecast of TEU volume and surge risk"""
     now = datetime.now()
-    forecast = []
+    hours = (now.hour + np.arange(24)) % 24
     
-    for i in range(24):
-        future_time = now + timedelta(hours=i)
-        hour = future_time.hour
-        
-        # Pattern-based forecasting
-        base_teu = 150
-        if 6 <= hour <= 10:
-            multiplier = 1.4
-            risk = "MEDIUM"
-        elif 14 <= hour <= 18:
-            multiplier = 1.5
-            risk = "HIGH" if i < 6 else "MEDIUM"  # Higher risk for near-term
-        elif 22 <= hour or hour <= 5:
-            multiplier = 0.6
-            risk = "LOW"
-        else:
-            multiplier = 1.0
-            risk = "LOW"
-        
-        forecast.append({
+    risks = _HOUR_RISK[hours]
+    # Afternoon peak is HIGH risk in the near term (next 6 hours)
+    risks[:6][_HOUR_IS_PM_PEAK[hours[:6]]] = "HIGH"
+    
+    return [
+        {
             "hour": hour,
-            "time": future_time.strftime("%H:00"),
-            "expected_teu": int(base_teu * multiplier),
-            "deviation_from_baseline": round((multiplier - 1) * 100, 1),
+            "time": _HOUR_STR[hour],
+            "expected_teu": teu,
+            "deviation_from_baseline": deviation,
             "surge_risk": risk
-        })
+        }
+        for hour, teu, deviation, risk in zip(
+            hours.tolist(),
+            _HOUR_EXPECTED_TEU[hours].tolist(),
+            _HOUR_DEVIATION[hours].tolist(),
+            risks.tolist()
+        )
+    ]
+
+# In-flight Ollama generations keyed by payload, so identical concurrent
+# /api/rail-analysis requests (fixed prompt, non-streaming) share one call
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+def ollama_generate(payload, timeout, coalesce=False):
+    """
+    POST a non-streaming generate request to Ollama over the shared session.
+    Under gevent workers the wait on the socket yields, so concurrent
+    /api/chat and /api/rail-analysis requests overlap their Ollama latency.
+    With coalesce=True, a request whose payload is byte-identical to one
+    already in flight waits for that generation instead of queueing a
+    duplicate forward pass in Ollama. Only /api/rail-analysis uses this;
+    chat prompts differ per question and stream by default.
+    """
+    if not coalesce:
+        return OLLAMA_SESSION.post(
+            f"{OLLAMA_URL}/api/generate",
+            json=payload,
+            timeout=timeout
+        )
+    
+    key = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    with _INFLIGHT_LOCK:
+        call = _INFLIGHT.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = {"done": threading.Event(), "response": None, "error": None}
+            _INFLIGHT[key] = call
+    
+    if not is_leader:
+        if not call["done"].wait(timeout):
+            raise requests.exceptions.Timeout("Timed out waiting for shared Ollama request")
+        if call["error"] is not None:
+            raise call["error"]
+        return call["response"]
     
-    return forecast
+    try:
+        call["response"] = OLLAMA_SESSION.post(
+            f"{OLLAMA_URL}/api/generate",
+            json=payload,
+            timeout=timeout
+        )
+        return call["response"]
+    except Exception as e:
+        call["error"] = e
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[key]
+        call["done"].set()
+
+def ollama_generate_stream(payload, timeout):
+    """POST a streaming generate request; the caller iterates and closes the response"""
+    return OLLAMA_SESSION.post(
+        f"{OLLAMA_URL}/api/generate",
+        json=payload,
+        timeout=timeout,
+        stream=True
+    )
+
+def _ollama_sse(response, metrics):
+    """Relay Ollama's NDJSON token stream to the client as Server-Sent Events"""
+    try:
+        yield f"data: {orjson.dumps({'metrics': metrics, 'model': OLLAMA_MODEL}).decode()}\n\n"
+        for line in response.iter_lines():
+            if line:
+                yield f"data: {line.decode()}\n\n"
+    finally:
+        response.close()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "ok", "ollama_url": OLLAMA_URL, "model": OLLAMA_MODEL})
+    return jsonify({
+        "status": "ok",
+        "ollama_url": OLLAMA_URL,
+        "model": OLLAMA_MODEL,
+        "ollama_num_parallel": OLLAMA_NUM_PARALLEL
+    })
 
 @app.route('/api/ais-vessels', methods=['GET'])
 def get_ais_vessels():
@@ -202,11 +360,44 @@ def get_forecast():
     forecast = get_hourly_forecast()
     return jsonify({"forecast": forecast})
 
+# Chat prompt layout is ordered for Ollama's KV prefix cache: the static system
+# prompt, then a data block that stays byte-identical for a whole minute, then
+# the user question. Requests within the same minute only prefill the question.
+_CHAT_STATIC_PREFIX = f"{SYSTEM_PROMPT}\n\nCurrent Data:\n"
+
+@functools.lru_cache(maxsize=2)
+def _chat_prompt_prefix_for_minute(minute):
+    """Return the chat prompt prefix (static prompt + data block), rebuilt once per minute"""
+    metrics = get_current_metrics()
+    forecast = get_hourly_forecast()[:6]  # Next 6 hours
+    
+    # Build context with real-time data
+    context = f"""
+Current Port Metrics (as of {metrics['timestamp']}):
+- Current TEU volume: {metrics['current_teu_per_hour']} TEU/hour
+- 30-day baseline: {metrics['baseline_30day_avg']} TEU/hour
+- Deviation from baseline: {metrics['percent_deviation']}%
+- Surge Risk Level: {metrics['surge_risk']}
+- Vessels in channel: {metrics['vessels_in_channel']}
+- Vessels at berth: {metrics['vessels_at_berth']}
+- Rail cars waiting: {metrics['rail_cars_waiting']}
+- Avg dwell time: {metrics['avg_dwell_time_hours']} hours
+
+Next 6-Hour Forecast:
+"""
+    for f in forecast:
+        context += f"  {f['time']}: {f['expected_teu']} TEU, {f['surge_risk']} risk\n"
+    
+    return _CHAT_STATIC_PREFIX + context
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """
     Chat endpoint that forwards queries to Ollama
     Expects JSON: {"message": "your question here"}
+    Streams tokens as Server-Sent Events: a first event with {"metrics", "model"},
+    then each Ollama chunk ({"response": "...", "done": false}).
+    Pass ?stream=0 for a single JSON response instead.
     """
     try:
         data = request.get_json()
@@ -215,46 +406,44 @@ def chat():
         if not user_message:
             return jsonify({"error": "No message provided"}), 400
         
-        # Get current metrics to include as context
+        # Shared prefix (static instructions + per-minute data) first, question last
+        # (the minute-old data block stays inside the prompt; clients get live metrics)
+        prompt_prefix = _chat_prompt_prefix_for_minute(int(time.time()) // 60)
         metrics = get_current_metrics()
-        forecast = get_hourly_forecast()[:6]  # Next 6 hours
+        prompt = f"{prompt_prefix}\n\nUser Question: {user_message}\n\nResponse:"
         
-        # Build context with real-time data
-        context = f"""
-Current Port Metrics (as of {metrics['timestamp']}):
-- Current TEU volume: {metrics['current_teu_per_hour']} TEU/hour
-- 30-day baseline: {metrics['baseline_30day_avg']} TEU/hour
-- Deviation from baseline: {metrics['percent_deviation']}%
-- Surge Risk Level: {metrics['surge_risk']}
-- Vessels in channel: {metrics['vessels_in_channel']}
-- Vessels at berth: {metrics['vessels_at_berth']}
-- Rail cars waiting: {metrics['rail_cars_waiting']}
-- Avg dwell time: {metrics['avg_dwell_time_hours']} hours
-
-Next 6-Hour Forecast:
-"""
-        for f in forecast:
-            context += f"  {f['time']}: {f['expected_teu']} TEU, {f['surge_risk']} risk\n"
-        
-        # Prepare Ollama request
-        prompt = f"{SYSTEM_PROMPT}\n\nCurrent Data:\n{context}\n\nUser Question: {user_message}\n\nResponse:"
+        stream = request.args.get('stream', '1') != '0'
+        # Shorter answers free Ollama's parallel slots sooner
+        max_tokens = request.args.get('max_tokens', CHAT_NUM_PREDICT, type=int)
+        num_predict = max(1, min(max_tokens, CHAT_NUM_PREDICT))
         
         ollama_payload = {
             "model": OLLAMA_MODEL,
             "prompt": prompt,
-            "stream": False,
+            "stream": stream,
             "options": {
                 "temperature": 0.7,
-                "num_predict": 500
+                "num_predict": num_predict
             }
         }
         
+        if stream:
+            response = ollama_generate_stream(ollama_payload, timeout=60)
+            if response.status_code != 200:
+                details = response.text
+                response.close()
+                return jsonify({
+                    "error": f"Ollama error: {response.status_code}",
+                    "details": details
+                }), 500
+            return Response(
+                _ollama_sse(response, metrics),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
         # Call Ollama API
-        response = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json=ollama_payload,
-            timeout=60
-        )
+        response = ollama_generate(ollama_payload, timeout=60)
         
         if response.status_code == 200:
             result = response.json()
@@ -304,70 +493,91 @@ def surge_analysis():
     
     return jsonify(analysis)
 
-@app.route('/api/rail-analysis', methods=['GET'])
-def rail_analysis():
+def _format_rows(columns, rows):
+    """Render (row index, row dict) pairs as an aligned text table, like DataFrame.to_string()"""
+    table = [[''] + columns] + [[str(idx)] + [row.get(c) or 'NaN' for c in columns] for idx, row in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(table[0]))]
+    return "\n".join("  ".join(v.rjust(w) for v, w in zip(r, widths)) for r in table)
+
+def build_rail_context():
     """
-    Analyze rail nodes with inbound freight forecasts using Ollama.
-    Query params: ship_count, forecast_window (hours)
-    Returns structured node status data.
+    Summarize the static railroad CSVs into the prompt context for rail analysis.
+    The files never change while the server runs, so this is computed once at
+    startup rather than re-parsed on every /api/rail-analysis request.
+    Single streaming pass per file with csv + running aggregates (no pandas).
     """
     try:
-        # Get query parameters
-        ship_count = request.args.get('ship_count', 15, type=int)
-        forecast_window = request.args.get('forecast_window', 72, type=int)
-        
-        # Load rail data from CSV files
-        import pandas as pd
-        
-        try:
-            nodes_df = pd.read_csv('data/railroad-nodes.csv')
-            lines_df = pd.read_csv('data/railroad-lines.csv')
-            texas_rail_df = pd.read_csv('data/texas_rail_data.csv', sep='\t', on_bad_lines='skip')
-        except Exception as e:
-            # Fallback if files not found
-            nodes_df = None
-            lines_df = None
-            texas_rail_df = None
+        # Get Texas nodes summary
+        with open('data/railroad-nodes.csv', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            node_columns = reader.fieldnames
+            filter_state = 'STATE' in node_columns
+            node_count = passenger_stations = boundary_nodes = 0
+            sample_nodes = []
+            for idx, row in enumerate(reader):
+                if filter_state and row['STATE'] != 'TX':
+                    continue
+                node_count += 1
+                if row.get('PASSNGRSTN'):
+                    passenger_stations += 1
+                if row.get('BNDRY') == '1':
+                    boundary_nodes += 1
+                if len(sample_nodes) < 10:
+                    sample_nodes.append((idx, row))
         
-        # Build context from rail data
-        rail_context = ""
-        
-        if nodes_df is not None:
-            # Get Texas nodes summary
-            tx_nodes = nodes_df[nodes_df['STATE'] == 'TX'] if 'STATE' in nodes_df.columns else nodes_df
-            node_count = len(tx_nodes)
-            passenger_stations = len(tx_nodes[tx_nodes['PASSNGRSTN'].notna()]) if 'PASSNGRSTN' in tx_nodes.columns else 0
-            boundary_nodes = len(tx_nodes[tx_nodes['BNDRY'] == 1]) if 'BNDRY' in tx_nodes.columns else 0
-            
-            rail_context += f"""
+        # Get Texas rail lines summary
+        with open('data/railroad-lines.csv', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            line_columns = reader.fieldnames
+            filter_state = 'STATEAB' in line_columns
+            total_miles = 0.0
+            owners = Counter()
+            sample_lines = []
+            for idx, row in enumerate(reader):
+                if filter_state and row['STATEAB'] != 'TX':
+                    continue
+                if row.get('MILES'):
+                    total_miles += float(row['MILES'])
+                if row.get('RROWNER1'):
+                    owners[row['RROWNER1']] += 1
+                if len(sample_lines) < 5:
+                    sample_lines.append((idx, row))
+    except Exception as e:
+        # Fallback if files not found
+        print(f"Error loading rail data: {e}")
+        return ""
+    
+    # Owner breakdown
+    owner_counts = dict(owners.most_common(10))
+    
+    return f"""
 Railroad Nodes Summary (Texas):
 - Total nodes: {node_count}
 - Passenger stations: {passenger_stations}
 - Boundary/interchange points: {boundary_nodes}
 
 Sample node data (first 10):
-{tx_nodes.head(10).to_string()}
-"""
-        
-        if lines_df is not None:
-            # Get Texas rail lines summary
-            tx_lines = lines_df[lines_df['STATEAB'] == 'TX'] if 'STATEAB' in lines_df.columns else lines_df
-            total_miles = tx_lines['MILES'].sum() if 'MILES' in tx_lines.columns else 0
-            
-            # Owner breakdown
-            if 'RROWNER1' in tx_lines.columns:
-                owner_counts = tx_lines['RROWNER1'].value_counts().head(10).to_dict()
-            else:
-                owner_counts = {}
-            
-            rail_context += f"""
+{_format_rows(node_columns, sample_nodes)}
+
 Railroad Lines Summary (Texas):
 - Total track miles: {total_miles:.1f}
 - Rail owners: {owner_counts}
 
 Sample line data (first 5):
-{tx_lines.head(5).to_string()}
+{_format_rows(line_columns, sample_lines)}
 """
+
+@app.route('/api/rail-analysis', methods=['GET'])
+def rail_analysis():
+    """
+    Analyze rail nodes with inbound freight forecasts using Ollama.
+    Query params: ship_count, forecast_window (hours)
+    Returns structured node status data.
+    """
+    try:
+        # Get query parameters
+        ship_count = request.args.get('ship_count', 15, type=int)
+        forecast_window = request.args.get('forecast_window', 72, type=int)
         
         # Ship forecast context - distribute ships across time windows
         ships_per_window = ship_count // 3
@@ -393,7 +603,7 @@ Estimated freight conversion:
         # Build the analysis prompt
         analysis_prompt = f"""Analyze the following railroad and freight data. Return ONLY structured JSON data, no prose.
 
-{rail_context}
+{RAIL_CONTEXT}
 
 {forecast_context}
 
@@ -436,11 +646,7 @@ Return JSON in this exact format:
             }
         }
         
-        response = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json=ollama_payload,
-            timeout=120
-        )
+        response = ollama_generate(ollama_payload, timeout=120, coalesce=True)
         
         if response.status_code == 200:
             result = response.json()
@@ -448,8 +654,8 @@ Return JSON in this exact format:
             
             # Try to parse as JSON
             try:
-                analysis_data = json.loads(llm_response)
-            except json.JSONDecodeError:
+                analysis_data = orjson.loads(llm_response)
+            except orjson.JSONDecodeError:
                 # If not valid JSON, return raw response
                 analysis_data = {"raw_response": llm_response, "parse_error": True}
             
@@ -472,7 +678,6 @@ Return JSON in this exact format:
             "hint": "Run 'ollama serve' to start the server"
         }), 503
     except Exception as e:
-        import traceback
         return jsonify({
             "error": str(e),
             "traceback": traceback.format_exc()
@@ -481,91 +686,223 @@ Return JSON in this exact format:
 # ========== SHIP TRACKING ENDPOINTS ==========
 
 SHIP_TRACKER_FILE = 'data/ship_tracker.json'
+SHIP_TRACKER_LOCK_FILE = SHIP_TRACKER_FILE + '.lock'
+SHIP_TRACKER_LOCK_TIMEOUT = 10.0  # seconds to wait for another worker's save
+SHIP_TRACKER_HISTORY_LIMIT = 1000  # keep last N history entries
+
+def _with_history_buffer(data):
+    """Hold history in a bounded deque so appends drop the oldest entries in O(1)"""
+    data['history'] = deque(data.get('history', []), maxlen=SHIP_TRACKER_HISTORY_LIMIT)
+    return data
+
+def _tracker_to_json(data):
+    """Shallow copy of tracker data with history as a JSON-serializable list"""
+    return {**data, 'history': list(data.get('history', []))}
 
 def load_ship_tracker():
     """Load ship tracker data from file"""
     try:
         if os.path.exists(SHIP_TRACKER_FILE):
-            with open(SHIP_TRACKER_FILE, 'r') as f:
-                return json.load(f)
+            with open(SHIP_TRACKER_FILE, 'rb') as f:
+                return _with_history_buffer(orjson.loads(f.read()))
     except Exception as e:
         print(f"Error loading ship tracker: {e}")
-    return {"vessels": {}, "history": [], "stats": {}}
+    return _with_history_buffer({"vessels": {}, "history": [], "stats": {}})
 
 def save_ship_tracker(data):
-    """Save ship tracker data to file"""
+    """
+    Save ship tracker data to file.
+    Writes compact JSON to a temp file and renames it over the original, so a
+    crash mid-write never leaves a truncated tracker file behind.
+    """
+    tmp_file = None
     try:
-        os.makedirs(os.path.dirname(SHIP_TRACKER_FILE), exist_ok=True)
-        with open(SHIP_TRACKER_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        tracker_dir = os.path.dirname(SHIP_TRACKER_FILE)
+        os.makedirs(tracker_dir, exist_ok=True)
+        # Unique temp file in the same directory, so concurrent writers never
+        # share an inode and the rename stays on one filesystem
+        with tempfile.NamedTemporaryFile(dir=tracker_dir, prefix='ship_tracker.', suffix='.tmp', delete=False) as f:
+            tmp_file = f.name
+            f.write(orjson.dumps(_tracker_to_json(data)))
+        os.chmod(tmp_file, 0o644)  # NamedTemporaryFile creates 0600
+        os.replace(tmp_file, SHIP_TRACKER_FILE)
         return True
     except Exception as e:
         print(f"Error saving ship tracker: {e}")
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
         return False
 
+def _ship_tracker_version():
+    """
+    Identity of the tracker file on disk, or None if it does not exist.
+    Every save replaces the file, so the inode changes even when two writes
+    land within the filesystem's mtime resolution.
+    """
+    try:
+        st = os.stat(SHIP_TRACKER_FILE)
+        return (st.st_ino, st.st_mtime_ns)
+    except OSError:
+        return None
+
+@contextlib.contextmanager
+def _ship_tracker_file_lock():
+    """
+    Exclusive cross-process lock so read-modify-write of the tracker file is
+    serialized across workers (fcntl.flock, so POSIX only, like gunicorn).
+    Polls with LOCK_NB and a gevent-friendly sleep rather than blocking in
+    flock, which would stall every greenlet in the worker.
+    """
+    os.makedirs(os.path.dirname(SHIP_TRACKER_LOCK_FILE), exist_ok=True)
+    with open(SHIP_TRACKER_LOCK_FILE, 'a') as lock_file:
+        deadline = time.monotonic() + SHIP_TRACKER_LOCK_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Timed out waiting for the ship tracker lock")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# In-memory tracker state (_TRACKER/_TRACKER_VERSION are loaded at startup below).
+# Reads are served from memory and only re-parse the file after another process
+# replaced it; updates are written through to disk before the POST returns.
+_TRACKER_LOCK = threading.RLock()
+
+# Secondary indexes over _TRACKER['vessels'] (value -> ordered set of mmsi keys)
+# so filtered and aggregate endpoints touch only the matching vessels
+_BY_STATUS = {}
+_BY_TERMINAL = {}
+# Position of each mmsi in _TRACKER['vessels']; updates keep a vessel's dict
+# position, so results are sorted by this to return vessels in tracker order
+_VESSEL_POS = {}
+
+def _index_vessel(mmsi, vessel):
+    """Add a vessel to the status/terminal indexes"""
+    _VESSEL_POS.setdefault(mmsi, len(_VESSEL_POS))
+    _BY_STATUS.setdefault(vessel.get('status', 'unknown'), {})[mmsi] = None
+    terminal = vessel.get('terminal')
+    if terminal:
+        _BY_TERMINAL.setdefault(terminal, {})[mmsi] = None
+
+def _unindex_vessel(mmsi, vessel):
+    """Remove a vessel from the status/terminal indexes"""
+    for index, key in ((_BY_STATUS, vessel.get('status', 'unknown')), (_BY_TERMINAL, vessel.get('terminal'))):
+        members = index.get(key)
+        if members is not None:
+            members.pop(mmsi, None)
+            if not members:
+                del index[key]
+
+def _rebuild_tracker_indexes():
+    """Rebuild the indexes after _TRACKER is replaced wholesale"""
+    _BY_STATUS.clear()
+    _BY_TERMINAL.clear()
+    _VESSEL_POS.clear()
+    for mmsi, vessel in _TRACKER.get('vessels', {}).items():
+        _index_vessel(mmsi, vessel)
+
+def _in_tracker_order(mmsis):
+    """Sort matched mmsi keys by their position in _TRACKER['vessels']"""
+    return sorted(mmsis, key=_VESSEL_POS.__getitem__)
+
+def get_tracker():
+    """
+    Return the in-memory tracker (caller must hold _TRACKER_LOCK).
+    The file is only re-parsed when it changed on disk, i.e. another
+    worker process or an external tool wrote it since we last loaded.
+    """
+    global _TRACKER, _TRACKER_VERSION
+    version = _ship_tracker_version()
+    if version != _TRACKER_VERSION:
+        _TRACKER = load_ship_tracker()
+        _TRACKER_VERSION = version
+        _rebuild_tracker_indexes()
+    return _TRACKER
+
 @app.route('/api/ship-tracker', methods=['GET'])
 def get_ship_tracker():
     """Get current ship tracking data"""
-    data = load_ship_tracker()
-    return jsonify(data)
+    with _TRACKER_LOCK:
+        return jsonify(_tracker_to_json(get_tracker()))
 
 @app.route('/api/ship-tracker', methods=['POST'])
 def update_ship_tracker():
     """Update ship tracking data"""
+    global _TRACKER, _TRACKER_VERSION
     try:
         new_data = request.get_json()
         if not new_data:
             return jsonify({"error": "No data provided"}), 400
         
-        # Merge with existing data or replace
-        if new_data.get('merge'):
-            existing = load_ship_tracker()
-            # Merge vessels
-            for mmsi, vessel in new_data.get('vessels', {}).items():
-                existing['vessels'][mmsi] = vessel
-            # Append history
-            existing['history'].extend(new_data.get('history', []))
-            # Keep last 1000 history entries
-            existing['history'] = existing['history'][-1000:]
-            # Update stats
-            existing['stats'] = new_data.get('stats', existing.get('stats', {}))
-            new_data = existing
-        
-        if save_ship_tracker(new_data):
-            return jsonify({"success": True, "vessels_count": len(new_data.get('vessels', {}))})
-        else:
-            return jsonify({"error": "Failed to save data"}), 500
+        # Hold the file lock across reload, merge and save so concurrent
+        # updates from other workers are merged rather than overwritten
+        with _TRACKER_LOCK, _ship_tracker_file_lock():
+            # Merge with existing data or replace
+            if new_data.get('merge'):
+                existing = get_tracker()
+                # Merge vessels, keeping the indexes in step
+                for mmsi, vessel in new_data.get('vessels', {}).items():
+                    previous = existing['vessels'].get(mmsi)
+                    if previous is not None:
+                        _unindex_vessel(mmsi, previous)
+                    existing['vessels'][mmsi] = vessel
+                    _index_vessel(mmsi, vessel)
+                # Append history (deque keeps only the last SHIP_TRACKER_HISTORY_LIMIT)
+                existing['history'].extend(new_data.get('history', []))
+                # Update stats
+                existing['stats'] = new_data.get('stats', existing.get('stats', {}))
+                new_data = existing
+            else:
+                _TRACKER = _with_history_buffer(new_data)
+                _rebuild_tracker_indexes()
+            
+            if save_ship_tracker(_TRACKER):
+                _TRACKER_VERSION = _ship_tracker_version()
+                return jsonify({"success": True, "vessels_count": len(new_data.get('vessels', {}))})
+            else:
+                # Discard the unsaved change; the next read reloads from disk
+                _TRACKER_VERSION = None
+                return jsonify({"error": "Failed to save data"}), 500
             
     except Exception as e:
+        # A partially applied update must not linger in memory
+        _TRACKER_VERSION = None
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/ship-tracker/vessels', methods=['GET'])
 def get_tracked_vessels():
     """Get all tracked vessels with optional status filter"""
-    # Always reload from file to get fresh data (no caching)
-    data = load_ship_tracker()
     status_filter = request.args.get('status')
     
-    vessels = list(data.get('vessels', {}).values())
-    
-    if status_filter:
-        vessels = [v for v in vessels if v.get('status') == status_filter]
-    
-    return jsonify({"vessels": vessels, "count": len(vessels)})
+    with _TRACKER_LOCK:
+        all_vessels = get_tracker().get('vessels', {})
+        
+        if status_filter:
+            vessels = [all_vessels[m] for m in _in_tracker_order(_BY_STATUS.get(status_filter, ()))]
+        else:
+            vessels = list(all_vessels.values())
+        
+        return jsonify({"vessels": vessels, "count": len(vessels)})
 
 @app.route('/api/ship-tracker/docked', methods=['GET'])
 def get_docked_vessels():
     """Get vessels that are currently docked or unloading"""
-    data = load_ship_tracker()
-    vessels = list(data.get('vessels', {}).values())
-    
-    docked = [v for v in vessels if v.get('status') in ['docked', 'unloading']]
-    
-    return jsonify({
-        "docked": docked,
-        "count": len(docked),
-        "by_terminal": _group_by_terminal(docked)
-    })
+    with _TRACKER_LOCK:
+        vessels = get_tracker().get('vessels', {})
+        
+        docked = [vessels[m] for m in _in_tracker_order(itertools.chain(_BY_STATUS.get('docked', ()), _BY_STATUS.get('unloading', ())))]
+        
+        return jsonify({
+            "docked": docked,
+            "count": len(docked),
+            "by_terminal": _group_by_terminal(docked)
+        })
 
 def _group_by_terminal(vessels):
     """Group vessels by terminal"""
@@ -580,51 +917,78 @@ def _group_by_terminal(vessels):
 @app.route('/api/ship-tracker/history', methods=['GET'])
 def get_tracker_history():
     """Get vessel status change history"""
-    data = load_ship_tracker()
     limit = request.args.get('limit', 50, type=int)
     
-    history = data.get('history', [])[-limit:]
-    history.reverse()  # Most recent first
+    with _TRACKER_LOCK:
+        # Most recent first, touching only the last `limit` entries
+        history = list(itertools.islice(reversed(get_tracker()['history']), max(limit, 0)))
     
     return jsonify({"history": history, "count": len(history)})
 
 @app.route('/api/ship-tracker/stats', methods=['GET'])
 def get_tracker_stats():
     """Get tracking statistics"""
-    data = load_ship_tracker()
-    vessels = list(data.get('vessels', {}).values())
-    
-    stats = {
-        "total_tracked": len(vessels),
-        "by_status": {},
-        "by_terminal": {},
-        "last_updated": data.get('stats', {}).get('lastUpdated')
-    }
-    
-    for v in vessels:
-        status = v.get('status', 'unknown')
-        stats['by_status'][status] = stats['by_status'].get(status, 0) + 1
+    with _TRACKER_LOCK:
+        data = get_tracker()
         
-        terminal = v.get('terminal')
-        if terminal:
-            stats['by_terminal'][terminal] = stats['by_terminal'].get(terminal, 0) + 1
+        stats = {
+            "total_tracked": len(data.get('vessels', {})),
+            "by_status": {status: len(m) for status, m in _BY_STATUS.items()},
+            "by_terminal": {terminal: len(m) for terminal, m in _BY_TERMINAL.items()},
+            "last_updated": data.get('stats', {}).get('lastUpdated')
+        }
     
     return jsonify(stats)
 
+# ========== STARTUP ==========
+
+def _warmup_ollama():
+    """Prefill Ollama's KV cache with the static chat prompt prefix (1-token generate)"""
+    try:
+        OLLAMA_SESSION.post(
+            f"{OLLAMA_URL}/api/generate",
+            json={
+                "model": OLLAMA_MODEL,
+                "prompt": _CHAT_STATIC_PREFIX,
+                "stream": False,
+                "options": {"num_predict": 1}
+            },
+            # Give up quickly on an unreachable server; allow time for a model load
+            timeout=(3, 60)
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Ollama warm-up skipped: {e}")
+
+# Startup legs are independent and I/O-bound, so run them concurrently.
+# Import waits for the data the endpoints need; the warm-up finishes on a daemon
+# thread so it never holds up interpreter exit.
+threading.Thread(target=_warmup_ollama, daemon=True).start()
+_startup_executor = ThreadPoolExecutor(max_workers=2)
+_rail_context_future = _startup_executor.submit(build_rail_context)
+_tracker_future = _startup_executor.submit(load_ship_tracker)
+RAIL_CONTEXT = _rail_context_future.result()
+_TRACKER = _tracker_future.result()
+_TRACKER_VERSION = _ship_tracker_version()
+_startup_executor.shutdown(wait=False)
+
+_rebuild_tracker_indexes()
+
 if __name__ == '__main__':
     print(f"Starting API server...")
     print(f"Ollama URL: {OLLAMA_URL}")
     print(f"Model: {OLLAMA_MODEL}")
+    print(f"Ollama parallelism: OLLAMA_NUM_PARALLEL={OLLAMA_NUM_PARALLEL}, OLLAMA_MAX_LOADED_MODELS={OLLAMA_MAX_LOADED_MODELS}")
+    print(f"Chat max tokens: {CHAT_NUM_PREDICT}")
     print(f"Endpoints:")
     print(f"  GET  /api/health - Health check")
     print(f"  GET  /api/metrics - Current port metrics")
     print(f"  GET  /api/forecast - 24-hour forecast")
     print(f"  GET  /api/surge-analysis - Detailed surge analysis")
-    print(f"  POST /api/chat - Chat with AI (send JSON: {{\"message\": \"your question\"}})")
+    print(f"  POST /api/chat - Chat with AI (send JSON: {{\"message\": \"your question\"}}, ?max_tokens=N, ?stream=0)")
     print(f"  GET  /api/rail-analysis - Analyze rail nodes (?ship_count=N&forecast_window=H)")
     print(f"  GET  /api/ship-tracker - Get ship tracking data")
     print(f"  POST /api/ship-tracker - Update ship tracking data")
     print(f"  GET  /api/ship-tracker/docked - Get docked vessels")
     print(f"  GET  /api/ship-tracker/history - Get status change history")
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=5001)
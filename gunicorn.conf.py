@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration for the Port-to-Rail API server.
+Every endpoint is I/O-bound (Ollama HTTP calls + JSON file I/O), so gevent
+workers multiplex many in-flight requests on greenlets.
+
+Usage: gunicorn -c gunicorn.conf.py api_server:app
+"""
+
+import os
+
+bind = os.environ.get("API_BIND", "0.0.0.0:5001")
+worker_class = "gevent"
+# One worker by default: the ship tracker, in-flight Ollama coalescing and the
+# per-second metric caches are process-local, and a single gevent worker already
+# serves up to worker_connections requests concurrently. Raise API_WORKERS only
+# for CPU-bound load; each extra worker keeps its own caches.
+workers = int(os.environ.get("API_WORKERS", 1))
+worker_connections = 1000
+keepalive = 30
+# Ollama generations can take up to 120s (rail analysis)
+timeout = 180
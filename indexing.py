@@ -1,47 +1,60 @@
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-
 import os
-import pandas as pd
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+import multiprocessing
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xxhash
 from langchain_core.documents import Document
 
-# Get all CSV files from data folder
-data_folder = "data"
-csv_files = [f for f in os.listdir(data_folder) if f.endswith('.csv')]
+# torch, faiss, the embeddings model and the text splitter are imported inside
+# main()/add_batch(): "spawn" workers re-import this module and only need
+# file_to_documents, so they stay light and start quickly.
 
-print(f"Found {len(csv_files)} CSV files to process...")
+data_folder = "data"
 
-# Process each CSV file
-all_documents = []
+def load_table(file_path):
+    """
+    Load a data file as a Polars DataFrame (all columns as strings).
+    If a Parquet copy sits next to the CSV it is read instead,
+    which skips CSV tokenization entirely.
+    """
+    parquet_path = os.path.splitext(file_path)[0] + '.parquet'
+    if os.path.exists(parquet_path):
+        # Cast typed Parquet columns so row texts match the all-string CSV path
+        return pl.read_parquet(parquet_path).with_columns(pl.all().cast(pl.Utf8))
+    
+    try:
+        # Try reading with comma separator first
+        return pl.read_csv(file_path, encoding='utf8', infer_schema_length=0)
+    except:
+        # If that fails, try tab separator
+        return pl.read_csv(file_path, separator='\t', encoding='utf8', infer_schema_length=0)
 
-for csv_file in csv_files:
+def file_to_documents(csv_file):
+    """Convert every row of one data file into a text Document."""
     file_path = os.path.join(data_folder, csv_file)
     print(f"Processing {csv_file}...")
     
     try:
-        # Try reading with comma separator first
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-        except:
-            # If that fails, try tab separator
-            df = pd.read_csv(file_path, sep='\t', encoding='utf-8')
+        df = load_table(file_path)
         
-        # Convert each row to a text document
-        for idx, row in df.iterrows():
-            # Create a readable text representation of the row
-            row_text_parts = []
-            for col, val in row.items():
-                if pd.notna(val):  # Only include non-null values
-                    row_text_parts.append(f"{col}: {val}")
-            
-            row_text = ", ".join(row_text_parts)
-            
-            # Create document with metadata
-            doc = Document(
+        # Create a readable "col: val, col: val" text for every row in one
+        # columnar pass; null cells drop out of the concatenation
+        row_texts = df.select(
+            pl.concat_str(
+                [pl.lit(f"{col}: ") + pl.col(col).cast(pl.Utf8) for col in df.columns],
+                separator=", ",
+                ignore_nulls=True
+            )
+        ).to_series().to_list()
+        
+        # Convert each row to a text document with metadata
+        documents = [
+            Document(
                 page_content=row_text,
                 metadata={
                     "source_file": csv_file,
@@ -49,44 +62,151 @@ for csv_file in csv_files:
                     "file_type": "csv"
                 }
             )
-            all_documents.append(doc)
+            for idx, row_text in enumerate(row_texts)
+        ]
         
         print(f"  Added {len(df)} rows from {csv_file}")
+        return documents
     
     except Exception as e:
         print(f"  Error processing {csv_file}: {str(e)}")
-        continue
-
-print(f"\nTotal documents created: {len(all_documents)}")
+        return []
 
-# Chunk documents
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=50
-)
-chunked_documents = splitter.split_documents(all_documents)
+# Columns of the document table stored next to the FAISS index (row i == vector id i)
+DOCS_SCHEMA = pa.schema([
+    ("page_content", pa.string()),
+    ("source_file", pa.string()),
+    ("row_index", pa.int64()),
+    ("file_type", pa.string()),
+    ("content_hash", pa.uint64())
+])
 
-print(f"Total chunks after splitting: {len(chunked_documents)}")
-
-# Embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
-
-# Store in Chroma
-db = Chroma(
-    persist_directory="./chroma",
-    embedding_function=embeddings
-)
+def add_batch(index, batch, embeddings, docs_writer):
+    """Embed a batch of chunks, add the vectors to the index and append their text/metadata to the document table."""
+    import faiss
+    
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in batch]), dtype=np.float32)
+    
+    if index is None:
+        # HNSW graph (32 links per node) over int8 vectors. Components of unit
+        # vectors lie in [-1, 1], so the quantizer is trained on that fixed range
+        # rather than on the first batch, whose min/max would clip later files.
+        dim = vectors.shape[1]
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+        index.train(np.vstack([np.full(dim, -1.0), np.full(dim, 1.0)]).astype(np.float32))
+    
+    index.add(vectors)
+    docs_writer.write_table(pa.table({
+        "page_content": [d.page_content for d in batch],
+        "source_file": [d.metadata["source_file"] for d in batch],
+        "row_index": [d.metadata["row_index"] for d in batch],
+        "file_type": [d.metadata["file_type"] for d in batch],
+        "content_hash": [d.metadata["content_hash"] for d in batch]
+    }, schema=DOCS_SCHEMA))
+    return index
 
-# Add documents in batches to avoid exceeding ChromaDB's batch size limit
-batch_size = 5000
-total_docs = len(chunked_documents)
-print(f"Adding {total_docs} documents in batches of {batch_size}...")
+def main():
+    import faiss
+    import torch
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from langchain_huggingface import HuggingFaceEmbeddings
+    
+    # Get all CSV files from data folder
+    csv_files = [f for f in os.listdir(data_folder) if f.endswith('.csv')]
+    
+    print(f"Found {len(csv_files)} CSV files to process...")
+    
+    def document_stream():
+        """Yield row documents file by file as the worker processes finish them"""
+        # Process CSV files in parallel, one per worker process. "spawn" avoids
+        # forking while Polars' thread pool is live. At most max_workers files
+        # are in flight; the next file is submitted only once a finished one has
+        # been consumed, so results don't pile up while embedding catches up.
+        max_workers = max(1, min(len(csv_files), os.cpu_count() or 1))
+        files = iter(csv_files)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending = deque(executor.submit(file_to_documents, f) for f in itertools.islice(files, max_workers))
+            while pending:
+                yield from pending.popleft().result()
+                next_file = next(files, None)
+                if next_file is not None:
+                    pending.append(executor.submit(file_to_documents, next_file))
+    
+    # Chunk documents
+    chunk_size = 500
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=50
+    )
+    
+    # Embeddings: large encode batches keep the GPU (or CPU BLAS) busy
+    embeddings = HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"batch_size": 256, "normalize_embeddings": True}
+    )
+    
+    # Vector store: FAISS HNSW graph over int8 scalar-quantized, unit-normalized
+    # vectors (inner product == cosine similarity), so top-k search is logarithmic
+    # rather than a full scan. Document text and metadata live in a Parquet file
+    # whose row i matches vector id i.
+    index_dir = "./faiss_index"
+    os.makedirs(index_dir, exist_ok=True)
+    index = None
+    
+    # Stream documents through the splitter and embed/add them in batches, so
+    # only one batch of chunks (plus the files in flight) is held in memory
+    batch_size = 5000
+    batch = []
+    total_documents = 0
+    total_chunks = 0
+    batch_count = 0
+    seen_hashes = set()
+    duplicates_skipped = 0
+    print(f"Adding documents in batches of {batch_size}...")
+    
+    with pq.ParquetWriter(os.path.join(index_dir, "docs.parquet"), DOCS_SCHEMA) as docs_writer:
+        for doc in document_stream():
+            total_documents += 1
+            # Identical row texts (repeated across or within files) are embedded once
+            content_hash = xxhash.xxh3_64_intdigest(doc.page_content)
+            if content_hash in seen_hashes:
+                duplicates_skipped += 1
+                continue
+            seen_hashes.add(content_hash)
+            doc.metadata["content_hash"] = content_hash
+            
+            # Most CSV rows already fit in one chunk; only long rows need the splitter
+            if 0 < len(doc.page_content) <= chunk_size:
+                batch.append(doc)
+            else:
+                batch.extend(splitter.split_documents([doc]))
+            
+            if len(batch) >= batch_size:
+                index = add_batch(index, batch, embeddings, docs_writer)
+                total_chunks += len(batch)
+                batch_count += 1
+                print(f"  Added batch {batch_count} ({len(batch)} documents)")
+                batch = []
+        
+        if batch:
+            index = add_batch(index, batch, embeddings, docs_writer)
+            total_chunks += len(batch)
+            batch_count += 1
+            print(f"  Added batch {batch_count} ({len(batch)} documents)")
+    
+    print(f"\nTotal documents created: {total_documents}")
+    print(f"Duplicate documents skipped: {duplicates_skipped}")
+    print(f"Total chunks after splitting: {total_chunks}")
+    
+    if index is None:
+        print("No documents to index")
+        return
+    
+    faiss.write_index(index, os.path.join(index_dir, "index.faiss"))
+    
+    print(f"Indexing complete! Data stored in {index_dir}")
 
-for i in range(0, total_docs, batch_size):
-    batch = chunked_documents[i:i + batch_size]
-    db.add_documents(batch)
-    print(f"  Added batch {i//batch_size + 1} ({len(batch)} documents)")
 
-print("Indexing complete! Data stored in ./chroma")
+if __name__ == '__main__':
+    main()
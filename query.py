@@ -1,16 +1,20 @@
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-
 import subprocess
 import time
 import requests
 import atexit
 import signal
 import sys
+import functools
+from contextlib import asynccontextmanager
+import faiss
+import numpy as np
+import polars as pl
+import torch
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_ollama import OllamaLLM
+from fastapi import FastAPI
+from pydantic import BaseModel
 
 # Ollama server process handle
 ollama_process = None
@@ -36,8 +40,9 @@ def start_ollama_server():
         # Start ollama serve in background
         ollama_process = subprocess.Popen(
             ["ollama", "serve"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            # Nothing reads Ollama's request logs; a full pipe would block it
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
             start_new_session=True  # Detach from terminal signals
         )
         
@@ -80,31 +85,64 @@ def signal_handler(sig, frame):
     stop_ollama_server()
     sys.exit(0)
 
-# Register cleanup handlers
+# Register cleanup handler
 atexit.register(stop_ollama_server)
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
-# Start Ollama server
-if not start_ollama_server():
-    print("Cannot continue without Ollama server")
-    sys.exit(1)
-
-# Embeddings (must match indexing)
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
-
-# Load DB
-db = Chroma(
-    persist_directory="./chroma",
-    embedding_function=embeddings
-)
 
-retriever = db.as_retriever(search_kwargs={"k": 4})
+class OllamaContext:
+    """Context manager that ensures an Ollama server is running and stops it on exit if we started it."""
+    
+    def __enter__(self):
+        if not start_ollama_server():
+            raise RuntimeError("Cannot continue without Ollama server")
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        stop_ollama_server()
+        return False
 
-# Local 1.5B model
-llm = OllamaLLM(model="qwen2.5:1.5b")
+# Models and index are loaded on first use and then kept for the process lifetime
+
+@functools.lru_cache(maxsize=None)
+def get_embeddings():
+    """Embeddings (must match indexing)"""
+    return HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_index():
+    """Load the FAISS HNSW index and its document table (row i == vector id i)"""
+    index = faiss.read_index("./faiss_index/index.faiss")
+    # Candidates explored per search; higher trades latency for recall
+    faiss.ParameterSpace().set_index_parameter(index, "efSearch", 64)
+    documents = pl.read_parquet("./faiss_index/docs.parquet")
+    return index, documents
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    """Local 1.5B model"""
+    return OllamaLLM(model="qwen2.5:1.5b")
+
+@functools.lru_cache(maxsize=1024)
+def _embed(question):
+    """Embed a query once; repeated questions reuse the cached vector"""
+    return tuple(get_embeddings().embed_query(question))
+
+def retrieve(question, k=4):
+    """Return the k documents most similar to the question (cosine on normalized vectors)."""
+    index, documents = get_index()
+    query_vector = np.asarray([_embed(question)], dtype=np.float32)
+    _, ids = index.search(query_vector, k)
+    docs = []
+    for doc_id in ids[0]:
+        if doc_id == -1:
+            continue
+        row = documents.row(int(doc_id), named=True)
+        page_content = row.pop("page_content")
+        docs.append(Document(page_content=page_content, metadata=row))
+    return docs
 
 def query_data(question):
     """Query the indexed data and return an answer."""
@@ -112,7 +150,7 @@ def query_data(question):
     print("-" * 50)
     
     # Retrieve relevant documents
-    docs = retriever.invoke(question)
+    docs = retrieve(question)
     
     # Build context from retrieved documents
     context = "\n\n".join(d.page_content for d in docs)
@@ -134,26 +172,55 @@ Question:
 Based on the dataset above, provide a clear and accurate answer:"""
     
     # Get answer from LLM
-    answer = llm.invoke(prompt)
+    answer = get_llm().invoke(prompt)
     print(f"\nAnswer:\n{answer}\n")
     return answer
 
+# HTTP API (run with `uvicorn query:app`): Ollama and the models load once at
+# startup and are reused by every request
+@asynccontextmanager
+async def lifespan(app):
+    """Start Ollama and load models once for the lifetime of the server."""
+    with OllamaContext():
+        get_embeddings()
+        get_index()
+        get_llm()
+        yield
+
+app = FastAPI(lifespan=lifespan)
+
+class AskRequest(BaseModel):
+    question: str
+
+@app.post("/ask")
+def ask(request: AskRequest):
+    """Answer a question from the indexed data."""
+    return {"question": request.question, "answer": query_data(request.question)}
+
 # Interactive query loop
 if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
     print("Austin Port-to-Rail Data Query System")
     print("Type 'quit' or 'exit' to stop\n")
     
-    while True:
-        query = input("Enter your question: ").strip()
-        
-        if query.lower() in ['quit', 'exit', 'q']:
-            print("Goodbye!")
-            break
-        
-        if not query:
-            continue
-        
-        try:
-            query_data(query)
-        except Exception as e:
-            print(f"Error: {e}\n")
+    try:
+        with OllamaContext():
+            while True:
+                query = input("Enter your question: ").strip()
+                
+                if query.lower() in ['quit', 'exit', 'q']:
+                    print("Goodbye!")
+                    break
+                
+                if not query:
+                    continue
+                
+                try:
+                    query_data(query)
+                except Exception as e:
+                    print(f"Error: {e}\n")
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)